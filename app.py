@@ -6,6 +6,7 @@ from flask_login import LoginManager
 from flask_socketio import SocketIO
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from outbound import Outbox
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,6 +18,7 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 socketio = SocketIO()
+outbox = Outbox(socketio)
 
 def create_app():
     app = Flask(__name__)
@@ -35,6 +37,12 @@ def create_app():
         "pool_pre_ping": True,
     }
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+    # Per-connection outbound queue limits for room broadcasts
+    app.config["OUTBOUND_QUEUE_MAX"] = int(os.environ.get("OUTBOUND_QUEUE_MAX", 256))
+    app.config["OUTBOUND_HIGH_WATER"] = int(os.environ.get("OUTBOUND_HIGH_WATER", 32))
+    app.config["OUTBOUND_FLUSH_INTERVAL"] = float(os.environ.get("OUTBOUND_FLUSH_INTERVAL", 0.05))
+    # Operators read /api/metrics/outbound with this bearer token; unset disables it
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
     app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     
     # Ensure upload directory exists
@@ -49,6 +57,7 @@ def create_app():
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     socketio.init_app(app, cors_allowed_origins="*", async_mode='eventlet')
+    outbox.init_app(app)
     
     # Create tables
     with app.app_context():
@@ -0,0 +1,232 @@
+import logging
+import threading
+from collections import deque
+
+# Delivery policies for outbound events
+POLICY_NEVER_DROP = 'never_drop'  # always delivered; disconnect the client if it can't keep up
+POLICY_COALESCE = 'coalesce'      # newer frame with the same key replaces the pending one; droppable
+
+# Events not listed here are treated as never-drop
+EVENT_POLICIES = {
+    'new_message': (POLICY_NEVER_DROP, None),
+    'user_status': (POLICY_COALESCE, lambda data: ('user_status', data.get('user_id'))),
+    'user_typing': (POLICY_COALESCE, lambda data: ('user_typing', data.get('conversation_id'), data.get('user_id'))),
+}
+
+# Coalesced events in the order they are dropped from a full queue
+DROP_ORDER = ('user_typing', 'user_status')
+
+# Held queues are keyed by sid alone, so every emit goes through the default namespace
+NAMESPACE = '/'
+
+# Sent once a queue that lost coalesced frames drains, so the client refetches state
+RESYNC_EVENT = 'resync'
+
+
+class _ConnectionQueue:
+    """Frames waiting to be handed to engine.io for a single connection."""
+
+    __slots__ = ('frames', 'pending_keys', 'needs_resync')
+
+    def __init__(self):
+        self.frames = deque()    # entries are [event, data, coalesce_key]
+        self.pending_keys = {}   # coalesce_key -> entry in frames
+        self.needs_resync = False
+
+    def append(self, event, data, key):
+        entry = [event, data, key]
+        self.frames.append(entry)
+        if key is not None:
+            self.pending_keys[key] = entry
+
+    def coalesce(self, key, data):
+        entry = self.pending_keys.get(key)
+        if entry is None:
+            return False
+        entry[1] = data
+        return True
+
+    def drop_oldest_droppable(self):
+        # Pending coalesced frames hold the latest state for their key, so
+        # losing one leaves the client stale until it resyncs.
+        for event in DROP_ORDER:
+            for entry in self.frames:
+                if entry[0] == event:
+                    self.frames.remove(entry)
+                    del self.pending_keys[entry[2]]
+                    self.needs_resync = True
+                    return entry
+        return None
+
+    def popleft(self):
+        entry = self.frames.popleft()
+        if entry[2] is not None:
+            del self.pending_keys[entry[2]]
+        return entry
+
+
+class Outbox:
+    """Room and broadcast emits with bounded per-connection outbound queues.
+
+    Frames go straight to engine.io while a client keeps up. Once a client's
+    engine.io queue grows past ``OUTBOUND_HIGH_WATER`` further frames are held
+    here, at most ``OUTBOUND_QUEUE_MAX`` per connection, and a background task
+    feeds them through as the client drains. When a held queue is full,
+    typing and then presence frames are dropped first and the client is sent
+    a resync frame once it catches up; if a message still does not fit, the
+    client is disconnected so it can reconnect and reload history.
+    """
+
+    def __init__(self, socketio=None):
+        self.socketio = socketio
+        self.queue_max = 256
+        self.high_water = 32
+        self.flush_interval = 0.05
+        self._queues = {}
+        self._evicted = set()             # kept until the disconnect handler discards them
+        self._pending_disconnects = set()
+        self._lock = threading.Lock()
+        self._pump_started = False
+        self._stats = {
+            'frames_sent': 0,
+            'frames_queued': 0,
+            'frames_coalesced': 0,
+            'frames_dropped': {},
+            'resyncs_requested': 0,
+            'slow_consumer_disconnects': 0,
+            'max_queue_depth': 0,
+        }
+
+    def init_app(self, app, socketio=None):
+        if socketio is not None:
+            self.socketio = socketio
+        self.queue_max = app.config.get('OUTBOUND_QUEUE_MAX', self.queue_max)
+        self.high_water = app.config.get('OUTBOUND_HIGH_WATER', self.high_water)
+        self.flush_interval = app.config.get('OUTBOUND_FLUSH_INTERVAL', self.flush_interval)
+
+    def emit(self, event, data, room=None, skip_sid=None):
+        """Send ``event`` to every connection in ``room`` (all connections if None)."""
+        manager = self.socketio.server.manager
+        ready = []
+        with self._lock:
+            for sid, eio_sid in manager.get_participants(NAMESPACE, room):
+                if sid == skip_sid or sid in self._evicted:
+                    continue
+                queue = self._queues.get(sid)
+                if queue is None and self._engine_depth(eio_sid) < self.high_water:
+                    ready.append(sid)
+                else:
+                    self._enqueue(sid, event, data)
+            if ready:
+                self.socketio.emit(event, data, to=ready, namespace=NAMESPACE)
+                self._stats['frames_sent'] += len(ready)
+
+    def discard(self, sid):
+        """Forget any state held for a connection that has gone away.
+
+        Returns True if the connection was dropped here as a slow consumer.
+        """
+        with self._lock:
+            self._queues.pop(sid, None)
+            self._pending_disconnects.discard(sid)
+            if sid in self._evicted:
+                self._evicted.discard(sid)
+                return True
+            return False
+
+    def stats(self):
+        with self._lock:
+            depths = [len(queue.frames) for queue in self._queues.values()]
+            stats = dict(self._stats)
+            stats['frames_dropped'] = dict(self._stats['frames_dropped'])
+            stats['backlogged_connections'] = len(depths)
+            stats['queued_frames'] = sum(depths)
+            stats['current_max_queue_depth'] = max(depths, default=0)
+            return stats
+
+    def _enqueue(self, sid, event, data):
+        policy, key_func = EVENT_POLICIES.get(event, (POLICY_NEVER_DROP, None))
+        key = key_func(data) if policy == POLICY_COALESCE else None
+
+        queue = self._queues.get(sid)
+        if queue is None:
+            queue = self._queues[sid] = _ConnectionQueue()
+            self._start_pump()
+        elif key is not None and queue.coalesce(key, data):
+            self._stats['frames_coalesced'] += 1
+            return
+
+        if len(queue.frames) >= self.queue_max:
+            dropped = queue.drop_oldest_droppable()
+            if dropped is not None:
+                self._count_drop(dropped[0])
+            elif key is not None:
+                queue.needs_resync = True
+                self._count_drop(event)
+                return
+            else:
+                # A message can't be delivered in order; make the client resync
+                self._queues.pop(sid, None)
+                self._evicted.add(sid)
+                self._pending_disconnects.add(sid)
+                self._stats['slow_consumer_disconnects'] += 1
+                logging.warning(f"Disconnecting slow consumer {sid}: outbound queue full")
+                return
+
+        queue.append(event, data, key)
+        self._stats['frames_queued'] += 1
+        if len(queue.frames) > self._stats['max_queue_depth']:
+            self._stats['max_queue_depth'] = len(queue.frames)
+
+    def _count_drop(self, event):
+        dropped = self._stats['frames_dropped']
+        dropped[event] = dropped.get(event, 0) + 1
+
+    def _engine_depth(self, eio_sid):
+        socket = self.socketio.server.eio.sockets.get(eio_sid)
+        if socket is None:
+            return 0
+        return socket.queue.qsize()
+
+    def _start_pump(self):
+        if not self._pump_started:
+            self._pump_started = True
+            self.socketio.start_background_task(self._pump)
+
+    def _pump(self):
+        while True:
+            self.socketio.sleep(self.flush_interval)
+            try:
+                self._flush()
+            except Exception:
+                logging.exception("Outbound queue flush failed")
+
+    def _flush(self):
+        manager = self.socketio.server.manager
+        with self._lock:
+            evicted, self._pending_disconnects = self._pending_disconnects, set()
+            for sid in list(self._evicted - evicted):
+                if manager.eio_sid_from_sid(sid, NAMESPACE) is None:
+                    self._evicted.discard(sid)
+            for sid, queue in list(self._queues.items()):
+                eio_sid = manager.eio_sid_from_sid(sid, NAMESPACE)
+                if eio_sid is None:
+                    del self._queues[sid]
+                    continue
+                budget = self.high_water - self._engine_depth(eio_sid)
+                while budget > 0 and queue.frames:
+                    event, data, _ = queue.popleft()
+                    self.socketio.emit(event, data, to=sid, namespace=NAMESPACE)
+                    self._stats['frames_sent'] += 1
+                    budget -= 1
+                if not queue.frames:
+                    if queue.needs_resync:
+                        self.socketio.emit(RESYNC_EVENT, {}, to=sid, namespace=NAMESPACE)
+                        self._stats['resyncs_requested'] += 1
+                    del self._queues[sid]
+
+        # Disconnect outside the lock: the disconnect handler broadcasts
+        # presence through this outbox again. Evicted sids stay skipped by
+        # emit() until that handler calls discard().
+        for sid in evicted:
+            self.socketio.server.disconnect(sid, namespace=NAMESPACE)
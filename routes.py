@@ -1,12 +1,13 @@
+import hmac
 import os
 import uuid
 from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, send_from_directory, abort
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room, leave_room
 from werkzeug.utils import secure_filename
 from sqlalchemy import or_, and_
-from app import db, socketio
+from app import db, socketio, outbox
 from models import User, Conversation, ConversationParticipant, Message
 
 main_bp = Blueprint('main', __name__)
@@ -39,6 +40,16 @@ def get_conversations():
     conversations = current_user.get_conversations()
     return jsonify([conv.to_dict(current_user.id) for conv in conversations])
 
+@main_bp.route('/api/presence')
+@login_required
+def get_presence():
+    users = User.query.filter(User.id != current_user.id).all()
+    return jsonify([{
+        'user_id': user.id,
+        'is_online': user.is_online,
+        'last_seen': user.last_seen.isoformat() if user.last_seen else None
+    } for user in users])
+
 @main_bp.route('/api/conversations/<int:conversation_id>/messages')
 @login_required
 def get_messages(conversation_id):
@@ -249,6 +260,17 @@ def remove_avatar():
     
     return jsonify({'error': 'No avatar to remove'}), 400
 
+@main_bp.route('/api/metrics/outbound')
+def outbound_metrics():
+    # Server-wide metrics are for operators only, not chat users
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(outbox.stats())
+
 # Socket.IO events
 @socketio.on('connect')
 @login_required
@@ -262,23 +284,29 @@ def handle_connect():
     for conv in conversations:
         join_room(f'conversation_{conv.id}')
     
-    emit('user_status', {
+    outbox.emit('user_status', {
         'user_id': current_user.id,
         'is_online': True
-    }, broadcast=True)
+    })
 
 @socketio.on('disconnect')
 @login_required
 def handle_disconnect():
+    evicted = outbox.discard(request.sid)
     current_user.is_online = False
     current_user.last_seen = datetime.utcnow()
     db.session.commit()
     
-    emit('user_status', {
+    # Slow consumers dropped by the outbox reconnect shortly; don't flap their presence
+    if evicted:
+        return
+    
+    # The disconnecting sid stays in its rooms until this handler returns
+    outbox.emit('user_status', {
         'user_id': current_user.id,
         'is_online': False,
         'last_seen': current_user.last_seen.isoformat()
-    }, broadcast=True)
+    }, skip_sid=request.sid)
 
 @socketio.on('join_conversation')
 @login_required
@@ -343,7 +371,7 @@ def handle_send_message(data):
     db.session.commit()
     
     # Emit to all participants in the conversation
-    socketio.emit('new_message', message.to_dict(), room=f'conversation_{conversation_id}')
+    outbox.emit('new_message', message.to_dict(), room=f'conversation_{conversation_id}')
 
 @socketio.on('typing')
 @login_required
@@ -358,9 +386,9 @@ def handle_typing(data):
     ).first()
     
     if participant:
-        emit('user_typing', {
+        outbox.emit('user_typing', {
             'user_id': current_user.id,
             'username': current_user.username,
             'conversation_id': conversation_id,
             'is_typing': is_typing
-        }, room=f'conversation_{conversation_id}', include_self=False)
+        }, room=f'conversation_{conversation_id}', skip_sid=request.sid)
@@ -9,6 +9,10 @@ class ChatApp {
         this.recordingStartTime = null;
         this.typingTimeout = null;
         this.isTyping = false;
+        this.hasConnected = false;
+        this.conversationUpdatedAt = null;
+        this.connectedAt = null;
+        this.evictions = 0;
         
         this.init();
     }
@@ -24,10 +28,30 @@ class ChatApp {
         
         this.socket.on('connect', () => {
             console.log('Connected to server');
+            this.connectedAt = Date.now();
+            
+            // Frames may have been dropped while we were away
+            if (this.hasConnected) {
+                this.resync();
+            } else {
+                this.loadConversations();
+            }
+            this.hasConnected = true;
         });
         
-        this.socket.on('disconnect', () => {
+        this.socket.on('disconnect', (reason) => {
             console.log('Disconnected from server');
+            
+            // The server drops clients that fall too far behind; reconnect to resync,
+            // backing off so a client that stays slow doesn't churn the server
+            if (reason === 'io server disconnect') {
+                if (Date.now() - this.connectedAt > 60000) {
+                    this.evictions = 0;
+                }
+                const backoff = Math.min(30000, 1000 * 2 ** this.evictions);
+                this.evictions++;
+                setTimeout(() => this.socket.connect(), backoff * (0.5 + Math.random()));
+            }
         });
         
         this.socket.on('new_message', (message) => {
@@ -42,11 +66,75 @@ class ChatApp {
             this.handleUserStatus(data);
         });
         
+        this.socket.on('resync', () => {
+            this.resync();
+        });
+        
         this.socket.on('error', (data) => {
             this.showAlert('Error: ' + data.message, 'danger');
         });
     }
     
+    resync() {
+        // The server drops typing and presence frames for clients that fall behind
+        document.getElementById('typingIndicator').style.display = 'none';
+        
+        if (this.currentConversationId) {
+            this.socket.emit('join_conversation', {
+                conversation_id: this.currentConversationId
+            });
+            this.loadMessages(this.currentConversationId);
+        }
+        
+        this.loadConversations();
+        this.loadPresence();
+    }
+    
+    async loadConversations() {
+        try {
+            const response = await fetch('/api/conversations');
+            const conversations = await response.json();
+            
+            if (!response.ok) return;
+            
+            const known = this.conversationUpdatedAt;
+            this.conversationUpdatedAt = {};
+            conversations.forEach(conversation => {
+                this.conversationUpdatedAt[conversation.id] = conversation.updated_at;
+            });
+            
+            // First load only records where each conversation stands
+            if (!known) return;
+            
+            // The sidebar is rendered server-side, so reload to show conversations created while away
+            if (conversations.some(conversation => !(conversation.id in known))) {
+                window.location.reload();
+                return;
+            }
+            
+            conversations.forEach(conversation => {
+                if (known[conversation.id] !== conversation.updated_at) {
+                    this.updateConversationTimestamp(conversation.id);
+                }
+            });
+        } catch (error) {
+            console.error('Error loading conversations:', error);
+        }
+    }
+    
+    async loadPresence() {
+        try {
+            const response = await fetch('/api/presence');
+            const statuses = await response.json();
+            
+            if (response.ok) {
+                statuses.forEach(status => this.handleUserStatus(status));
+            }
+        } catch (error) {
+            console.error('Error loading presence:', error);
+        }
+    }
+    
     bindEvents() {
         // Message form submission
         document.getElementById('messageForm').addEventListener('submit', (e) => {
@@ -0,0 +1,4 @@
+import os
+
+# app.py builds the application at import time from the environment
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
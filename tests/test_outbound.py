@@ -0,0 +1,267 @@
+import os
+import time
+
+import pytest
+
+from outbound import Outbox, RESYNC_EVENT
+
+
+class FakeEngineQueue:
+    def __init__(self):
+        self.depth = 0
+
+    def qsize(self):
+        return self.depth
+
+
+class FakeEngineSocket:
+    def __init__(self):
+        self.queue = FakeEngineQueue()
+
+
+class FakeManager:
+    def __init__(self):
+        self.rooms = {}  # room -> set of sids; None holds every connection
+
+    def get_participants(self, namespace, room):
+        for sid in list(self.rooms.get(room, ())):
+            yield sid, sid
+
+    def eio_sid_from_sid(self, sid, namespace):
+        return sid if sid in self.rooms.get(None, ()) else None
+
+
+class FakeServer:
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.manager = FakeManager()
+        self.eio = type('FakeEngine', (), {'sockets': {}})()
+
+    def disconnect(self, sid, namespace='/'):
+        self.socketio.disconnects.append(sid)
+        for members in self.manager.rooms.values():
+            members.discard(sid)
+        self.eio.sockets.pop(sid, None)
+        # What the app's disconnect handler does
+        self.socketio.outbox.discard(sid)
+        if self.socketio.on_disconnect:
+            self.socketio.on_disconnect(sid)
+
+
+class FakeSocketIO:
+    """Stands in for Flask-SocketIO: healthy clients drain instantly, slow ones never do."""
+
+    def __init__(self):
+        self.server = FakeServer(self)
+        self.outbox = None
+        self.slow = set()
+        self.received = {}
+        self.disconnects = []
+        self.on_disconnect = None
+        self.on_deliver = None
+
+    def connect(self, sid, rooms=(), slow=False):
+        self.server.eio.sockets[sid] = FakeEngineSocket()
+        for room in (None,) + tuple(rooms):
+            self.server.manager.rooms.setdefault(room, set()).add(sid)
+        if slow:
+            self.slow.add(sid)
+
+    def emit(self, event, data, to=None, namespace='/'):
+        for sid in ([to] if isinstance(to, str) else to):
+            if sid in self.slow:
+                self.server.eio.sockets[sid].queue.depth += 1
+            elif self.on_deliver:
+                self.on_deliver(sid, event, data)
+            else:
+                self.received.setdefault(sid, []).append((event, data))
+
+    def start_background_task(self, target):
+        pass
+
+
+@pytest.fixture
+def socketio():
+    socketio = FakeSocketIO()
+    socketio.outbox = Outbox(socketio)
+    return socketio
+
+
+def make_slow_drain(socketio, sid):
+    socketio.slow.discard(sid)
+    socketio.server.eio.sockets[sid].queue.depth = 0
+
+
+def test_held_queue_never_exceeds_queue_max(socketio):
+    outbox = socketio.outbox
+    outbox.queue_max = 8
+    outbox.high_water = 2
+    socketio.connect('slow', rooms=['conversation_1'], slow=True)
+
+    for i in range(100):
+        outbox.emit('user_status', {'user_id': i, 'is_online': True})
+        outbox.emit('user_typing', {'user_id': i, 'conversation_id': 1, 'is_typing': True},
+                    room='conversation_1')
+        assert outbox.stats()['current_max_queue_depth'] <= outbox.queue_max
+
+    assert outbox.stats()['max_queue_depth'] == outbox.queue_max
+    assert socketio.server.eio.sockets['slow'].queue.depth <= outbox.high_water
+
+
+def test_new_message_is_never_dropped(socketio):
+    outbox = socketio.outbox
+    outbox.queue_max = 4
+    outbox.high_water = 1
+    socketio.connect('lagging', rooms=['conversation_1'], slow=True)
+
+    for i in range(4):
+        outbox.emit('new_message', {'id': i}, room='conversation_1')
+    # Message 0 went straight to the engine queue; the rest were held here
+    make_slow_drain(socketio, 'lagging')
+    for _ in range(4):
+        outbox._flush()
+
+    assert [data['id'] for _, data in socketio.received['lagging']] == [1, 2, 3]
+    assert 'new_message' not in outbox.stats()['frames_dropped']
+
+
+def test_client_that_cannot_take_a_message_is_evicted(socketio):
+    outbox = socketio.outbox
+    outbox.queue_max = 4
+    outbox.high_water = 1
+    socketio.connect('healthy', rooms=['conversation_1'])
+    socketio.connect('slow', rooms=['conversation_1'], slow=True)
+
+    for i in range(10):
+        outbox.emit('new_message', {'id': i}, room='conversation_1')
+
+    stats = outbox.stats()
+    assert 'new_message' not in stats['frames_dropped']
+    assert stats['slow_consumer_disconnects'] == 1
+    assert [data['id'] for _, data in socketio.received['healthy']] == list(range(10))
+
+    # Nothing reaches the evicted client before it is disconnected
+    make_slow_drain(socketio, 'slow')
+    outbox.emit('new_message', {'id': 10}, room='conversation_1')
+    assert 'slow' not in socketio.received
+
+    outbox._flush()
+    assert socketio.disconnects == ['slow']
+    assert 'slow' not in socketio.received
+
+
+def test_typing_and_presence_coalesce_and_drop_first(socketio):
+    outbox = socketio.outbox
+    outbox.queue_max = 3
+    outbox.high_water = 1
+    socketio.connect('slow', rooms=['conversation_1'], slow=True)
+
+    outbox.emit('new_message', {'id': 0}, room='conversation_1')  # fills the engine queue
+    outbox.emit('user_status', {'user_id': 2, 'is_online': True})
+    outbox.emit('user_status', {'user_id': 2, 'is_online': False})
+    outbox.emit('user_typing', {'user_id': 3, 'conversation_id': 1, 'is_typing': True},
+                room='conversation_1')
+    outbox.emit('user_typing', {'user_id': 3, 'conversation_id': 1, 'is_typing': False},
+                room='conversation_1')
+    assert outbox.stats()['frames_coalesced'] == 2
+
+    outbox.emit('new_message', {'id': 1}, room='conversation_1')
+    outbox.emit('new_message', {'id': 2}, room='conversation_1')
+    assert outbox.stats()['frames_dropped'] == {'user_typing': 1}
+
+    outbox.emit('new_message', {'id': 3}, room='conversation_1')
+    assert outbox.stats()['frames_dropped'] == {'user_typing': 1, 'user_status': 1}
+    assert outbox.stats()['slow_consumer_disconnects'] == 0
+
+    make_slow_drain(socketio, 'slow')
+    for _ in range(4):
+        outbox._flush()
+
+    # Messages survive and the client is told to refetch the state it lost
+    events = [(event, data.get('id')) for event, data in socketio.received['slow']]
+    assert events == [('new_message', 1), ('new_message', 2), ('new_message', 3), (RESYNC_EVENT, None)]
+    assert outbox.stats()['resyncs_requested'] == 1
+
+
+def test_coalesced_frame_keeps_latest_state(socketio):
+    outbox = socketio.outbox
+    outbox.high_water = 1
+    socketio.connect('slow', slow=True)
+
+    outbox.emit('user_status', {'user_id': 2, 'is_online': True})
+    outbox.emit('user_status', {'user_id': 2, 'is_online': True})
+    outbox.emit('user_status', {'user_id': 2, 'is_online': False})
+    make_slow_drain(socketio, 'slow')
+    outbox._flush()
+
+    assert socketio.received['slow'] == [('user_status', {'user_id': 2, 'is_online': False})]
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pytest.skip('RSS is only measured on Linux')
+
+
+def test_slow_consumers_in_large_room(socketio):
+    # Delivery and engine.io buffering are modelled by FakeSocketIO: healthy
+    # clients receive synchronously inside emit() and slow ones only bump a
+    # depth counter. So latency here is the outbox's own per-frame cost and
+    # RSS covers the outbox's held queues, not real socket buffers.
+    outbox = socketio.outbox
+    room = 'conversation_1'
+    slow_count = 100
+    rounds = 600
+
+    for i in range(1000):
+        socketio.connect(f'client_{i}', rooms=[room], slow=i < slow_count)
+
+    # Evicted slow clients reconnect and stay slow, keeping 10% of the room stalled
+    reconnects = iter(range(10 ** 6))
+
+    def reconnect(sid):
+        socketio.connect(f'reconnected_{next(reconnects)}', rooms=[room], slow=True)
+
+    socketio.on_disconnect = reconnect
+
+    delivered = {}
+    latencies = []
+
+    def deliver(sid, event, data):
+        if event == 'new_message':
+            assert delivered.get(sid, -1) == data['id'] - 1
+            delivered[sid] = data['id']
+            latencies.append(time.perf_counter() - data['sent_at'])
+
+    socketio.on_deliver = deliver
+
+    rss_before = current_rss()
+    for i in range(rounds):
+        outbox.emit('new_message', {'id': i, 'content': 'x' * 200, 'sent_at': time.perf_counter()},
+                    room=room)
+        outbox.emit('user_typing', {'user_id': i % 20, 'conversation_id': 1, 'is_typing': i % 2 == 0},
+                    room=room)
+        if i % 3 == 0:
+            outbox.emit('user_status', {'user_id': i % 50, 'is_online': i % 2 == 0})
+        if i % 10 == 0:
+            outbox._flush()
+
+        stats = outbox.stats()
+        assert stats['current_max_queue_depth'] <= outbox.queue_max
+        assert stats['queued_frames'] <= slow_count * outbox.queue_max
+    rss_growth = current_rss() - rss_before
+
+    healthy = [f'client_{i}' for i in range(slow_count, 1000)]
+    assert all(delivered[sid] == rounds - 1 for sid in healthy)
+
+    latencies.sort()
+    assert latencies[int(len(latencies) * 0.99)] < 0.25
+    assert rss_growth < 64 * 1024 * 1024
+
+    stats = outbox.stats()
+    assert stats['slow_consumer_disconnects'] >= slow_count
+    assert 'new_message' not in stats['frames_dropped']
+    assert all(socket.queue.depth <= outbox.high_water
+               for socket in socketio.server.eio.sockets.values())
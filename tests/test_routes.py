@@ -0,0 +1,139 @@
+import pytest
+
+from app import app, db, outbox, socketio
+from models import User, Conversation, ConversationParticipant
+
+
+@pytest.fixture
+def users():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        alice = User(username='alice', email='alice@example.com')
+        bob = User(username='bob', email='bob@example.com')
+        for user in (alice, bob):
+            user.set_password('secret')
+        conversation = Conversation()
+        db.session.add_all([alice, bob, conversation])
+        db.session.flush()
+        db.session.add_all([
+            ConversationParticipant(conversation_id=conversation.id, user_id=alice.id),
+            ConversationParticipant(conversation_id=conversation.id, user_id=bob.id),
+        ])
+        db.session.commit()
+        ids = {'alice': alice.id, 'bob': bob.id, 'conversation': conversation.id}
+    # Requests must not share this app context, or flask-login caches one user on g
+    return ids
+
+
+@pytest.fixture(autouse=True)
+def fresh_outbox():
+    # Reset the module-level outbox's queues and counters between tests
+    outbox.__init__(socketio)
+    outbox.init_app(app)
+    yield
+    outbox.__init__(socketio)
+    outbox.init_app(app)
+    app.config['METRICS_TOKEN'] = None
+
+
+def login(username):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': username, 'password': 'secret'})
+    return client
+
+
+def connect(username):
+    return socketio.test_client(app, flask_test_client=login(username))
+
+
+def events(client, name):
+    return [packet['args'][0] for packet in client.get_received() if packet['name'] == name]
+
+
+def test_metrics_disabled_without_token():
+    assert app.test_client().get('/api/metrics/outbound').status_code == 404
+
+
+@pytest.mark.parametrize('header', [None, 'Bearer wrong', 'Bearer töken'])
+def test_metrics_rejects_bad_token(header):
+    app.config['METRICS_TOKEN'] = 'token'
+    headers = {'Authorization': header} if header else {}
+    assert app.test_client().get('/api/metrics/outbound', headers=headers).status_code == 401
+
+
+def test_metrics_with_token():
+    app.config['METRICS_TOKEN'] = 'token'
+    response = app.test_client().get('/api/metrics/outbound', headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    assert response.get_json()['slow_consumer_disconnects'] == 0
+
+
+def test_presence_requires_login(users):
+    assert app.test_client().get('/api/presence').status_code == 302
+
+    bob = connect('bob')
+    response = login('alice').get('/api/presence')
+    assert response.get_json() == [{
+        'user_id': users['bob'],
+        'is_online': True,
+        'last_seen': response.get_json()[0]['last_seen'],
+    }]
+    bob.disconnect()
+
+
+def test_room_broadcasts_go_through_outbox(users):
+    alice = connect('alice')
+    bob = connect('bob')
+    alice.get_received()
+    bob.get_received()
+
+    alice.emit('send_message', {'conversation_id': users['conversation'], 'content': 'hi'})
+    alice.emit('typing', {'conversation_id': users['conversation'], 'is_typing': True})
+
+    assert [message['content'] for message in events(bob, 'new_message')] == ['hi']
+    assert [message['content'] for message in events(alice, 'new_message')] == ['hi']
+    assert events(alice, 'user_typing') == []
+    assert outbox.stats()['frames_sent'] > 0
+
+    bob.disconnect()
+    assert events(alice, 'user_status') == [{
+        'user_id': users['bob'],
+        'is_online': False,
+        'last_seen': events_last_seen(users['bob']),
+    }]
+    alice.disconnect()
+
+
+def events_last_seen(user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).last_seen.isoformat()
+
+
+def test_evicted_client_is_disconnected_without_presence_flap(users):
+    alice = connect('alice')
+    bob = connect('bob')
+    alice.get_received()
+    bob.get_received()
+    alice_sid = socketio.server.manager.sid_from_eio_sid(alice.eio_sid, '/')
+    room = f"conversation_{users['conversation']}"
+
+    # Hold everything so bob's queue overflows on the second message
+    outbox.high_water = 0
+    outbox.queue_max = 1
+    outbox.emit('new_message', {'id': 1}, room=room, skip_sid=alice_sid)
+    outbox.emit('new_message', {'id': 2}, room=room, skip_sid=alice_sid)
+    assert outbox.stats()['slow_consumer_disconnects'] == 1
+
+    # Evicted clients get nothing more before they are disconnected
+    outbox.high_water = 32
+    outbox.emit('new_message', {'id': 3}, room=room)
+    assert [message['id'] for message in events(alice, 'new_message')] == [3]
+    assert events(bob, 'new_message') == []
+
+    outbox._flush()
+    assert not bob.is_connected()
+    assert alice.is_connected()
+    assert events(alice, 'user_status') == []
+    assert outbox.stats()['backlogged_connections'] == 0
+    alice.disconnect()